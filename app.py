@@ -1,585 +1,532 @@
 # app.py
-from flask import Flask, jsonify, abort, send_file, request
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response
+from decimal import Decimal
+import hashlib
+import logging
+import orjson
 import os
-from sqlalchemy import create_engine, text
+from pathlib import Path
+from sqlalchemy import text
 from sqlalchemy.engine import URL
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import re
 import traceback
+from functools import lru_cache
+
+from bucket_stream import encode_buckets, row_point
+from db_url import to_asyncpg_url
+from cache_keys import LOCATIONS_CACHE_PREFIX, TERMS_CACHE_PREFIX
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional: response caching is disabled without redis
+    aioredis = None
+
+# Connections per worker process; every endpoint, including dissociate, needs one per in-flight request.
+# The server sees up to workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections: the defaults keep 4 workers
+# at 80, under Postgres's default max_connections=100. Lower them for smaller hosted tiers.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds before a pooled connection is replaced; stands in for pool_pre_ping's per-checkout SELECT 1
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Seconds a cached term/location response stays in Redis
+CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))
+# Seconds to wait on Redis before treating the cache as down and going straight to Postgres
+CACHE_TIMEOUT = float(os.getenv("CACHE_TIMEOUT", "0.2"))
+# KNN result sizes. Inlined into the SQL as literals (not bound) so the planner always sees the real
+# LIMIT, including in asyncpg's generic prepared-statement plans
+NEAREST_N = 50
+DISSOCIATE_KNN_N = 100
+# Rows fetched per roundtrip from the server-side cursor when encoding dissociate results
+STREAM_YIELD_PER = 200
+
+def _orjson_default(obj):
+    # numeric columns may come back as Decimal; everything else orjson handles natively
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (Rust encoder, returns bytes directly)."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+# Static assets are resolved next to this file, not the current working directory, so importing app
+# (e.g. from query_terms.py) works from anywhere
+_BASE_DIR = Path(__file__).resolve().parent
+
+# Static image served by /img: read once at import, revalidated by ETag and cached by clients for a year
+_GIF = (_BASE_DIR / "amygdala.gif").read_bytes()
+_GIF_ETAG = f'"{hashlib.md5(_GIF).hexdigest()}"'
+_GIF_HEADERS = {"ETag": _GIF_ETAG, "Cache-Control": "public, max-age=31536000, immutable"}
+
+_WS = re.compile(r"\s+")
+_US = re.compile(r"_+")
+
+log = logging.getLogger(__name__)
 
 _engine = None
-
-def get_engine():
+_redis = None
+_redis_missing_warned = False
+
+# Static SQL, built once at import so SQLAlchemy's compiled cache and asyncpg's
+# prepared-statement cache see the same statement object on every request
+
+# Single statement: find matched study_ids (limit small), falling back to a relaxed LIKE match only
+# when the normalized equality finds nothing, then attach coords and the top-5 terms per study
+Q_TERM_STUDIES = text(r"""
+    WITH exact AS (
+        SELECT at.study_id, at.contrast_id, at.weight
+        FROM ns.annotations_terms at
+        WHERE trim(both '_' from regexp_replace(lower(at.term), '[\s_]+', '_', 'g')) = :term
+        ORDER BY at.weight DESC
+        LIMIT :lim
+    ), matched AS (
+        SELECT study_id, contrast_id, weight FROM exact
+        UNION ALL
+        (
+            SELECT at.study_id, at.contrast_id, at.weight
+            FROM ns.annotations_terms at
+            WHERE NOT EXISTS (SELECT 1 FROM exact)
+              AND lower(at.term) LIKE :term_like
+            ORDER BY at.weight DESC
+            LIMIT :lim
+        )
+    )
+    SELECT m.study_id, m.contrast_id, m.weight,
+           ST_X(c.geom) AS x, ST_Y(c.geom) AS y, coalesce(ST_Z(c.geom), 0::float8) AS z,
+           coalesce(tt.terms, '[]'::jsonb) AS top_terms
+    FROM matched m
+    LEFT JOIN ns.coordinates c ON m.study_id = c.study_id
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(jsonb_build_object('term', t.term, 'weight', t.weight) ORDER BY t.weight DESC) AS terms
+        FROM (
+            SELECT term, weight
+            FROM ns.annotations_terms
+            WHERE study_id = m.study_id
+            ORDER BY weight DESC
+            LIMIT 5
+        ) t
+    ) tt ON true
+    ORDER BY m.weight DESC;
+""")
+
+# Single SQL: find nearest N studies, then attach the top-5 terms per study via a LATERAL join.
+# The query point is built once in `q`; referencing it through a scalar subquery keeps the
+# right-hand side of `<->` a constant for the GiST KNN scan, and the distance is kept for the final sort.
+Q_NEAREST_STUDIES = text(rf"""
+    WITH q AS (
+        SELECT ST_SetSRID(ST_MakePoint(:x, :y, :z), 4326) AS g
+    ), nearest AS (
+        SELECT study_id, geom, geom <-> (SELECT g FROM q) AS dist
+        FROM ns.coordinates
+        ORDER BY geom <-> (SELECT g FROM q)
+        LIMIT {NEAREST_N}
+    )
+    SELECT n.study_id, ST_X(n.geom) AS x, ST_Y(n.geom) AS y, coalesce(ST_Z(n.geom), 0::float8) AS z,
+           coalesce(tt.terms, '[]'::jsonb) AS top_terms
+    FROM nearest n
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(jsonb_build_object('term', t.term, 'weight', t.weight) ORDER BY t.weight DESC) AS terms
+        FROM (
+            SELECT term, weight
+            FROM ns.annotations_terms
+            WHERE study_id = n.study_id
+            ORDER BY weight DESC
+            LIMIT 5
+        ) t
+    ) tt ON true
+    ORDER BY n.dist
+""")
+
+# One statement: A and B study-id sets, classified into a_only / b_only / overlap
+# with a FULL OUTER JOIN, plus coords and top-5 terms for every classified study
+Q_DISSOCIATE_TERMS = text(r"""
+    WITH a AS (
+        SELECT DISTINCT study_id
+        FROM ns.annotations_terms
+        WHERE trim(both '_' from regexp_replace(lower(term), '[\s_]+', '_', 'g')) = :term_a
+        LIMIT 1000
+    ), b AS (
+        SELECT DISTINCT study_id
+        FROM ns.annotations_terms
+        WHERE trim(both '_' from regexp_replace(lower(term), '[\s_]+', '_', 'g')) = :term_b
+        LIMIT 1000
+    ), classified AS (
+        SELECT study_id,
+               CASE WHEN a.study_id IS NULL THEN 'b_only'
+                    WHEN b.study_id IS NULL THEN 'a_only'
+                    ELSE 'overlap' END AS bucket
+        FROM a FULL OUTER JOIN b USING (study_id)
+    )
+    SELECT c.study_id, c.bucket, co.x, co.y, co.z,
+           coalesce(tt.terms, '[]'::jsonb) AS top_terms
+    FROM classified c
+    LEFT JOIN LATERAL (
+        SELECT ST_X(geom) AS x, ST_Y(geom) AS y, coalesce(ST_Z(geom), 0::float8) AS z
+        FROM ns.coordinates WHERE study_id = c.study_id LIMIT 1
+    ) co ON true
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(jsonb_build_object('term', t.term, 'weight', t.weight) ORDER BY t.weight DESC) AS terms
+        FROM (
+            SELECT term, weight
+            FROM ns.annotations_terms
+            WHERE study_id = c.study_id
+            ORDER BY weight DESC
+            LIMIT 5
+        ) t
+    ) tt ON true
+    ORDER BY c.bucket, c.study_id;
+""")
+
+# One statement: nearest N studies to each point (KNN), classified into a_only / b_only / overlap
+# with a FULL OUTER JOIN, plus coords and top-5 terms for every classified study. Adjust SRID if different.
+Q_DISSOCIATE_LOCATIONS = text(rf"""
+    WITH pa AS (
+        SELECT ST_SetSRID(ST_MakePoint(:ax, :ay, :az), 4326) AS g
+    ), pb AS (
+        SELECT ST_SetSRID(ST_MakePoint(:bx, :by, :bz), 4326) AS g
+    ), a AS (
+        SELECT DISTINCT study_id FROM (
+            SELECT study_id FROM ns.coordinates ORDER BY geom <-> (SELECT g FROM pa) LIMIT {DISSOCIATE_KNN_N}
+        ) knn
+    ), b AS (
+        SELECT DISTINCT study_id FROM (
+            SELECT study_id FROM ns.coordinates ORDER BY geom <-> (SELECT g FROM pb) LIMIT {DISSOCIATE_KNN_N}
+        ) knn
+    ), classified AS (
+        SELECT study_id,
+               CASE WHEN a.study_id IS NULL THEN 'b_only'
+                    WHEN b.study_id IS NULL THEN 'a_only'
+                    ELSE 'overlap' END AS bucket
+        FROM a FULL OUTER JOIN b USING (study_id)
+    )
+    SELECT c.study_id, c.bucket, co.x, co.y, co.z,
+           coalesce(tt.terms, '[]'::jsonb) AS top_terms
+    FROM classified c
+    LEFT JOIN LATERAL (
+        SELECT ST_X(geom) AS x, ST_Y(geom) AS y, coalesce(ST_Z(geom), 0::float8) AS z
+        FROM ns.coordinates WHERE study_id = c.study_id LIMIT 1
+    ) co ON true
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(jsonb_build_object('term', t.term, 'weight', t.weight) ORDER BY t.weight DESC) AS terms
+        FROM (
+            SELECT term, weight
+            FROM ns.annotations_terms
+            WHERE study_id = c.study_id
+            ORDER BY weight DESC
+            LIMIT 5
+        ) t
+    ) tt ON true
+    ORDER BY c.bucket, c.study_id;
+""")
+
+@lru_cache(maxsize=4096)
+def normalize_term(t: str) -> str:
+    """Normalize user input to the same canonical form used when importing terms (lowercase, single underscores)."""
+    s = t.strip().lower()
+    s = _WS.sub("_", s)
+    s = _US.sub("_", s)
+    return s.strip("_")
+
+def get_engine() -> AsyncEngine:
     global _engine
     if _engine is not None:
         return _engine
     db_url = os.getenv("DB_URL")
     if not db_url:
         raise RuntimeError("Missing DB_URL (or DATABASE_URL) environment variable.")
-    # Normalize old 'postgres://' scheme to 'postgresql://'
-    if db_url.startswith("postgres://"):
-        db_url = "postgresql://" + db_url[len("postgres://"):]
-    _engine = create_engine(
-        db_url,
-        pool_pre_ping=True,
+    url, connect_args = to_asyncpg_url(db_url)
+    # search_path is applied when each pooled connection is opened, not per request;
+    # settings given in DB_URL (application_name, options=-c ...) take precedence
+    server_settings = {"application_name": "ntu-info", "search_path": "ns,public"}
+    server_settings.update(connect_args.pop("server_settings", {}))
+    _engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=False,
+        # reuse the most recently returned (warm) connection first
+        pool_use_lifo=True,
+        connect_args={**connect_args, "server_settings": server_settings},
     )
     return _engine
 
-def create_app():
-    app = Flask(__name__)
+def get_redis():
+    """Return the shared Redis client, or None when REDIS_URL is unset or redis is not installed."""
+    global _redis, _redis_missing_warned
+    if _redis is not None:
+        return _redis
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        return None
+    if aioredis is None:
+        if not _redis_missing_warned:
+            log.warning("REDIS_URL is set but the redis package is not installed; response caching is disabled")
+            _redis_missing_warned = True
+        return None
+    # short timeouts so an unreachable Redis costs a few hundred ms, not a hung request
+    _redis = aioredis.from_url(redis_url, socket_connect_timeout=CACHE_TIMEOUT, socket_timeout=CACHE_TIMEOUT)
+    return _redis
+
+async def cache_get(key: str):
+    """Return cached response bytes for `key`, or None on a miss / when caching is off."""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        return await r.get(key)
+    except Exception as e:
+        # a cache outage must not take the API down; fall through to Postgres
+        log.warning("Redis GET %s failed: %r", key, e)
+        return None
+
+async def cache_set(key: str, body: bytes):
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        await r.setex(key, CACHE_TTL, body)
+    except Exception as e:
+        log.warning("Redis SETEX %s failed: %r", key, e)
 
-    def _parse_wkt_point(wkt: str):
-        """Parse WKT POINT/Z text like 'POINT Z (x y z)' or 'POINT(x y z)' into [x,y,z] or None."""
-        if not wkt:
-            return None
-        try:
-            m = re.search(r"POINT(?:\s+Z)?\s*\(([^)]+)\)", wkt)
-            if not m:
-                return None
-            parts = m.group(1).strip().split()
-            nums = [float(p) for p in parts]
-            if len(nums) == 2:
-                nums.append(0.0)
-            return nums
-        except Exception:
-            return None
-
-    @app.get("/", endpoint="health")
-    def health():
+def create_app():
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    async def _fetch_buckets(sql, params, head: dict) -> Response:
+        """Run a dissociate query and encode its a_only / b_only / overlap buckets.
+
+        Rows are fetched from a server-side cursor in batches and encoded as they arrive, but the
+        whole body is built before the response starts: the connection goes back to the pool as soon
+        as the cursor is drained (not after a slow client has read the body), and a DB failure at any
+        point still surfaces as a 500 instead of a truncated 200.
+        """
+        async with get_engine().connect() as conn:
+            result = await conn.stream(sql, params, execution_options={"yield_per": STREAM_YIELD_PER})
+            chunks = [chunk async for chunk in encode_buckets(result.mappings(), head, default=_orjson_default)]
+        return Response(b"".join(chunks), media_type="application/json")
+
+    @app.get("/", name="health", response_class=HTMLResponse)
+    async def health():
         return "<p>Server working!</p>"
 
-    @app.get("/img", endpoint="show_img")
-    def show_img():
-        return send_file("amygdala.gif", mimetype="image/gif")
-
-    @app.get("/terms/<term>", endpoint="terms_no_suffix")
-    @app.get("/terms/<term>/studies", endpoint="terms_studies")
-    def get_studies_by_term(term):
+    @app.get("/ui", name="ui")
+    async def ui():
+        # Minimal single-page UI to query the API endpoints from a browser; static, so let browsers/CDNs cache it
+        return FileResponse(_BASE_DIR / "static" / "ui.html", media_type="text/html",
+                            headers={"Cache-Control": "public, max-age=86400"})
+
+    @app.get("/img", name="show_img")
+    async def show_img(request: Request):
+        if request.headers.get("if-none-match") == _GIF_ETAG:
+            return Response(status_code=304, headers=_GIF_HEADERS)
+        return Response(_GIF, media_type="image/gif", headers=_GIF_HEADERS)
+
+    @app.get("/terms/{term}", name="terms_no_suffix")
+    @app.get("/terms/{term}/studies", name="terms_studies")
+    async def get_studies_by_term(term: str, request: Request):
         # Query DB for studies that mention `term` and include their coords + top terms
-        eng = get_engine()
-        # Normalize user input to the same canonical form used when importing terms
-        def norm_term_input(t: str) -> str:
-            if t is None:
-                return t
-            s = t.strip().lower()
-            s = re.sub(r"\s+", "_", s)
-            s = re.sub(r"_+", "_", s)
-            s = s.strip("_")
-            return s
-
-        term_norm = norm_term_input(term)
-
-        # Two-step query: first find matched study_ids (limit small), then fetch coords and top terms only for those ids
-        sql_find = text(r"""
-            WITH matched AS (
-                SELECT at.study_id, at.contrast_id, at.weight
-                FROM ns.annotations_terms at
-                WHERE trim(both '_' from regexp_replace(lower(at.term), '[\s_]+' , '_', 'g')) = :term
-                ORDER BY at.weight DESC
-                LIMIT :lim
-            )
-            SELECT study_id, contrast_id, weight FROM matched;
-        """)
-
-        sql_fetch = text(r"""
-            WITH top_terms AS (
-                SELECT study_id,
-                       jsonb_agg(jsonb_build_object('term', term, 'weight', weight) ORDER BY weight DESC) AS terms
-                FROM ns.annotations_terms
-                WHERE study_id IN (SELECT study_id FROM matched)
-                GROUP BY study_id
-            )
-            SELECT m.study_id, m.contrast_id, m.weight,
-                   (c.geom::text) AS geom_wkt,
-                   coalesce(tt.terms, '[]'::jsonb) AS top_terms
-            FROM (
-                SELECT study_id, contrast_id, weight FROM matched
-            ) m
-            LEFT JOIN ns.coordinates c ON m.study_id = c.study_id
-            LEFT JOIN top_terms tt ON m.study_id = tt.study_id
-            ORDER BY m.weight DESC;
-        """)
+        term_norm = normalize_term(term)
+
+        # Results are deterministic for a given normalized term, so serve repeats from Redis
+        cache_key = f"{TERMS_CACHE_PREFIX}{term_norm}"
+        cached = await cache_get(cache_key)
+        if cached is not None:
+            return Response(cached, media_type="application/json")
+
 
         try:
             eng = get_engine()
             LIMIT_SMALL = 50
-            with eng.begin() as conn:
-                # find top matched study ids using normalized equality
-                matched = conn.execute(sql_find, {"term": term_norm, "lim": LIMIT_SMALL}).mappings().all()
-                # If no exact normalized matches, relax to a LIKE search on lower(term)
-                if not matched:
-                    fallback_sql = text(r"""
-                        SELECT at.study_id, at.contrast_id, at.weight
-                        FROM ns.annotations_terms at
-                        WHERE lower(at.term) LIKE :term_like
-                        ORDER BY at.weight DESC
-                        LIMIT :lim
-                    """)
-                    term_like = f"%{term_norm}%"
-                    matched = conn.execute(fallback_sql, {"term_like": term_like, "lim": LIMIT_SMALL}).mappings().all()
-                    if matched:
-                        # note: caller may want to know we used a relaxed match; we include it in debug output via ?debug=1
-                        pass
-                if not matched:
-                    return jsonify({"query_term": term_norm, "count": 0, "studies": []})
-                # create a temporary CTE 'matched' for the fetch query by using the DB-side WITH from a VALUES clause
-                # Build a VALUES list for matched study rows to avoid re-running the expensive normalization across the whole table
-                vals = ",".join([f"(:sid{i}, :cid{i}, :w{i})" for i in range(len(matched))])
-                params = {}
-                for i, row in enumerate(matched):
-                    params[f"sid{i}"] = row["study_id"]
-                    params[f"cid{i}"] = row["contrast_id"]
-                    params[f"w{i}"] = row["weight"]
-
-                fetch_sql = text(r"""
-                    WITH matched(study_id, contrast_id, weight) AS (
-                        VALUES
-                        """ + vals + r"""
-                    ),
-                    top_terms AS (
-                        SELECT study_id,
-                               jsonb_agg(jsonb_build_object('term', term, 'weight', weight) ORDER BY weight DESC) AS terms
-                        FROM ns.annotations_terms
-                        WHERE study_id IN (SELECT study_id FROM matched)
-                        GROUP BY study_id
-                    )
-                    SELECT m.study_id, m.contrast_id, m.weight,
-                           (c.geom::text) AS geom_wkt,
-                           coalesce(tt.terms, '[]'::jsonb) AS top_terms
-                    FROM matched m
-                    LEFT JOIN ns.coordinates c ON m.study_id = c.study_id
-                    LEFT JOIN top_terms tt ON m.study_id = tt.study_id
-                    ORDER BY m.weight DESC;
-                """)
-
-                rows = conn.execute(fetch_sql, params).mappings().all()
+            params = {"term": term_norm, "term_like": f"%{term_norm}%", "lim": LIMIT_SMALL}
+            async with eng.begin() as conn:
+                rows = (await conn.execute(Q_TERM_STUDIES, params)).mappings().all()
 
             result = []
             for r in rows:
-                coords = None
-                if r.get("geom_wkt") is not None:
-                    coords = _parse_wkt_point(r.get("geom_wkt"))
                 result.append({
                     "study_id": r["study_id"],
                     "contrast_id": r["contrast_id"],
-                    "weight_for_query_term": float(r["weight"]) if r["weight"] is not None else None,
-                    "coords": coords,
-                    "top_terms": (r["top_terms"] if r["top_terms"] is not None else [])[:5]
+                    "weight_for_query_term": r["weight"],
+                    "coords": row_point(r),
+                    "top_terms": r["top_terms"]
                 })
 
             # Return a shape similar to /locations endpoint: query_term, count, studies
-            return jsonify({"query_term": term_norm, "count": len(result), "studies": result})
+            response = ORJSONResponse({"query_term": term_norm, "count": len(result), "studies": result})
+            await cache_set(cache_key, response.body)
+            return response
         except Exception as e:
-            if request.args.get('debug') == '1':
-                return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+            if request.query_params.get('debug') == '1':
+                return ORJSONResponse({"error": str(e), "traceback": traceback.format_exc()}, status_code=500)
             raise
 
-    @app.get("/locations/<coords>/studies", endpoint="locations_studies")
-    def get_studies_by_coordinates(coords):
+    @app.get("/locations/{coords}/studies", name="locations_studies")
+    async def get_studies_by_coordinates(coords: str):
         # Find nearest studies to coords and return their coordinates + top terms
         try:
             x, y, z = map(float, coords.split("_"))
         except Exception:
-            abort(400, "Invalid coordinates format; expected x_y_z")
-        # Single SQL: find nearest N studies, then aggregate top terms per study using CTEs
-        sql = text(r"""
-            WITH nearest AS (
-                SELECT study_id, geom
-                FROM ns.coordinates
-                ORDER BY geom <-> ST_SetSRID(ST_MakePoint(:x, :y, :z), 4326)
-                LIMIT :n
-            ), top_terms AS (
-                SELECT study_id,
-                       jsonb_agg(jsonb_build_object('term', term, 'weight', weight) ORDER BY weight DESC) AS terms
-                FROM ns.annotations_terms
-                WHERE study_id IN (SELECT study_id FROM nearest)
-                GROUP BY study_id
-            )
-            SELECT n.study_id, (n.geom::text) AS geom_wkt,
-                   coalesce(tt.terms, '[]'::jsonb) AS top_terms
-            FROM nearest n
-            LEFT JOIN top_terms tt ON n.study_id = tt.study_id
-            ORDER BY n.geom <-> ST_SetSRID(ST_MakePoint(:x, :y, :z), 4326)
-        """)
+            raise HTTPException(400, "Invalid coordinates format; expected x_y_z")
+
+        # Key on the exact parsed floats (repr round-trips losslessly), so '0_-52_26' and '0.0_-52.0_26'
+        # share an entry but two distinct query points never do
+        cache_key = f"{LOCATIONS_CACHE_PREFIX}{x!r}_{y!r}_{z!r}"
+        cached = await cache_get(cache_key)
+        if cached is not None:
+            return Response(cached, media_type="application/json")
 
         eng = get_engine()
-        N = 50
-        with eng.begin() as conn:
-            rows = conn.execute(sql, {"x": x, "y": y, "z": z, "n": N}).mappings().all()
+        async with eng.begin() as conn:
+            rows = (await conn.execute(Q_NEAREST_STUDIES, {"x": x, "y": y, "z": z})).mappings().all()
 
         result = []
         for r in rows:
-            coords = None
-            if r.get("geom_wkt") is not None:
-                coords = _parse_wkt_point(r.get("geom_wkt"))
             result.append({
                 "study_id": r["study_id"],
-                "coords": coords,
-                "top_terms": (r["top_terms"] if r["top_terms"] is not None else [])[:5]
+                "coords": row_point(r),
+                "top_terms": r["top_terms"]
             })
-        return jsonify({"query_coords": [x, y, z], "count": len(result), "nearest": result})
+        response = ORJSONResponse({"query_coords": [x, y, z], "count": len(result), "nearest": result})
+        await cache_set(cache_key, response.body)
+        return response
     
     # Updated: dissociate by two terms -> run A\B and B\A against the DB
-    @app.get("/dissociate/terms/<term_a>/<term_b>", endpoint="dissociate_terms")
-    def dissociate_terms(term_a, term_b):
-        def norm_term(t):
-            # reuse same normalization as other endpoints
-            s = t.strip().lower()
-            s = re.sub(r"\s+", "_", s)
-            s = re.sub(r"_+", "_", s)
-            return s.strip("_")
-
-        a_term = norm_term(term_a)
-        b_term = norm_term(term_b)
-
-        eng = get_engine()
+    @app.get("/dissociate/terms/{term_a}/{term_b}", name="dissociate_terms")
+    async def dissociate_terms(term_a: str, term_b: str):
+        a_term = normalize_term(term_a)
+        b_term = normalize_term(term_b)
+
+        head = {
+            "term_a_raw": term_a,
+            "term_b_raw": term_b,
+            "term_a": a_term,
+            "term_b": b_term,
+        }
         try:
-            with eng.begin() as conn:
-                conn.execute(text("SET search_path TO ns, public;"))
-
-                # Get study ids for each term (limit to 1000 to avoid huge IN lists)
-                # normalize term comparison in SQL to handle spaces/underscores/case
-                a_rows = conn.execute(text("""
-                    SELECT DISTINCT study_id
-                    FROM ns.annotations_terms
-                    WHERE trim(both '_' from regexp_replace(lower(term), '[\\s_]+', '_', 'g')) = :term
-                    LIMIT 1000
-                """), {"term": a_term}).scalars().all()
-
-                b_rows = conn.execute(text("""
-                    SELECT DISTINCT study_id
-                    FROM ns.annotations_terms
-                    WHERE trim(both '_' from regexp_replace(lower(term), '[\\s_]+', '_', 'g')) = :term
-                    LIMIT 1000
-                """), {"term": b_term}).scalars().all()
-
-                a_ids = set(a_rows)
-                b_ids = set(b_rows)
-
-                a_only_ids = list(a_ids - b_ids)
-                b_only_ids = list(b_ids - a_ids)
-                overlap_ids = list(a_ids & b_ids)
-
-                def fetch_details(study_ids):
-                    if not study_ids:
-                        return []
-                    params = {f"id{i}": sid for i, sid in enumerate(study_ids)}
-                    in_clause = ", ".join([f":id{i}" for i in range(len(study_ids))])
-
-                    coords_rows = conn.execute(text(f"""
-                        SELECT study_id, (geom::text) AS geom_wkt
-                        FROM ns.coordinates
-                        WHERE study_id IN ({in_clause})
-                    """), params).mappings().all()
-
-                    term_rows = conn.execute(text(f"""
-                        SELECT study_id, term, weight
-                        FROM ns.annotations_terms
-                        WHERE study_id IN ({in_clause})
-                        ORDER BY study_id, weight DESC
-                    """), params).mappings().all()
-
-                    top_terms = {}
-                    for tr in term_rows:
-                        sid = tr["study_id"]
-                        top_terms.setdefault(sid, []).append({"term": tr["term"], "weight": float(tr["weight"]) if tr["weight"] is not None else None})
-
-                    # parse WKT into coordinate lists
-                    coords_map = {}
-                    for r in coords_rows:
-                        wkt = r.get("geom_wkt")
-                        coords_map[r["study_id"]] = _parse_wkt_point(wkt)
-
-                    results = []
-                    for sid in study_ids:
-                        results.append({
-                            "study_id": sid,
-                            "coords": coords_map.get(sid),
-                            "top_terms": top_terms.get(sid, [])[:5]
-                        })
-                    return results
-
-                a_only = fetch_details(a_only_ids)
-                b_only = fetch_details(b_only_ids)
-                overlap = fetch_details(overlap_ids)
-
-            return jsonify({
-                "term_a_raw": term_a,
-                "term_b_raw": term_b,
-                "term_a": a_term,
-                "term_b": b_term,
-                "a_only_count": len(a_only),
-                "b_only_count": len(b_only),
-                "overlap_count": len(overlap),
-                "a_only": a_only,
-                "b_only": b_only,
-                "overlap": overlap
-            }), 200
+            return await _fetch_buckets(Q_DISSOCIATE_TERMS, {"term_a": a_term, "term_b": b_term}, head)
         except OperationalError as e:
-            abort(500, f"DB error: {e}")
+            raise HTTPException(500, f"DB error: {e}")
         except Exception as e:
-            abort(500, str(e))
+            raise HTTPException(500, str(e))
 
     # Updated: dissociate by two coordinate triples -> nearest-based A\B and B\A
-    @app.get("/dissociate/locations/<coords_a>/<coords_b>", endpoint="dissociate_locations")
-    def dissociate_locations(coords_a, coords_b):
+    @app.get("/dissociate/locations/{coords_a}/{coords_b}", name="dissociate_locations")
+    async def dissociate_locations(coords_a: str, coords_b: str):
         def parse_coords(s):
             parts = s.split("_")
             if len(parts) != 3:
-                abort(400, f"Invalid coordinates '{s}'")
+                raise HTTPException(400, f"Invalid coordinates '{s}'")
             try:
                 return [float(p) for p in parts]
             except ValueError:
-                abort(400, f"Invalid coordinates '{s}'")
+                raise HTTPException(400, f"Invalid coordinates '{s}'")
 
         a = parse_coords(coords_a)
         b = parse_coords(coords_b)
 
-        eng = get_engine()
+        params = {"ax": a[0], "ay": a[1], "az": a[2], "bx": b[0], "by": b[1], "bz": b[2]}
+        head = {"query_a": a, "query_b": b}
         try:
-            with eng.begin() as conn:
-                conn.execute(text("SET search_path TO ns, public;"))
-
-                # Find nearest N studies to each point (use KNN). Adjust SRID if different.
-                N = 100
-                a_rows = conn.execute(text("""
-                    SELECT study_id
-                    FROM ns.coordinates
-                    ORDER BY geom <-> ST_SetSRID(ST_MakePoint(:x, :y, :z), 4326)
-                    LIMIT :n
-                """), {"x": a[0], "y": a[1], "z": a[2], "n": N}).scalars().all()
-
-                b_rows = conn.execute(text("""
-                    SELECT study_id
-                    FROM ns.coordinates
-                    ORDER BY geom <-> ST_SetSRID(ST_MakePoint(:x, :y, :z), 4326)
-                    LIMIT :n
-                """), {"x": b[0], "y": b[1], "z": b[2], "n": N}).scalars().all()
-
-                a_ids = set(a_rows)
-                b_ids = set(b_rows)
-
-                a_only_ids = list(a_ids - b_ids)
-                b_only_ids = list(b_ids - a_ids)
-                overlap_ids = list(a_ids & b_ids)
-
-                def fetch_details(study_ids):
-                    if not study_ids:
-                        return []
-                    params = {f"id{i}": sid for i, sid in enumerate(study_ids)}
-                    in_clause = ", ".join([f":id{i}" for i in range(len(study_ids))])
-
-                    coords_rows = conn.execute(text(f"""
-                        SELECT study_id, (geom::text) AS geom_wkt
-                        FROM ns.coordinates
-                        WHERE study_id IN ({in_clause})
-                    """), params).mappings().all()
-
-                    term_rows = conn.execute(text(f"""
-                        SELECT study_id, term, weight
-                        FROM ns.annotations_terms
-                        WHERE study_id IN ({in_clause})
-                        ORDER BY study_id, weight DESC
-                    """), params).mappings().all()
-
-                    top_terms = {}
-                    for tr in term_rows:
-                        sid = tr["study_id"]
-                        top_terms.setdefault(sid, []).append({"term": tr["term"], "weight": float(tr["weight"]) if tr["weight"] is not None else None})
-
-                    coords_map = {}
-                    for r in coords_rows:
-                        wkt = r.get("geom_wkt")
-                        coords_map[r["study_id"]] = _parse_wkt_point(wkt)
-
-                    results = []
-                    for sid in study_ids:
-                        results.append({
-                            "study_id": sid,
-                            "coords": coords_map.get(sid),
-                            "top_terms": top_terms.get(sid, [])[:5]
-                        })
-                    return results
-
-                a_only = fetch_details(a_only_ids)
-                b_only = fetch_details(b_only_ids)
-                overlap = fetch_details(overlap_ids)
-
-            return jsonify({
-                "query_a": a,
-                "query_b": b,
-                "a_only_count": len(a_only),
-                "b_only_count": len(b_only),
-                "overlap_count": len(overlap),
-                "a_only": a_only,
-                "b_only": b_only,
-                "overlap": overlap
-            }), 200
+            return await _fetch_buckets(Q_DISSOCIATE_LOCATIONS, params, head)
         except OperationalError as e:
-            abort(500, f"DB error: {e}")
+            raise HTTPException(500, f"DB error: {e}")
         except Exception as e:
-            abort(500, str(e))
+            raise HTTPException(500, str(e))
 
-    @app.get("/test_db", endpoint="test_db")
+    @app.get("/test_db", name="test_db")
     
-    def test_db():
+    async def test_db():
         eng = get_engine()
-        payload = {"ok": False, "dialect": eng.dialect.name}
+        payload = {"ok": False, "dialect": eng.dialect.name, "driver": eng.dialect.driver}
 
         try:
-            with eng.begin() as conn:
-                # Ensure we are in the correct schema
-                conn.execute(text("SET search_path TO ns, public;"))
-                payload["version"] = conn.exec_driver_sql("SELECT version()").scalar()
+            async with eng.begin() as conn:
+                payload["version"] = (await conn.exec_driver_sql("SELECT version()")).scalar()
 
                 # Counts
-                payload["coordinates_count"] = conn.execute(text("SELECT COUNT(*) FROM ns.coordinates")).scalar()
-                payload["metadata_count"] = conn.execute(text("SELECT COUNT(*) FROM ns.metadata")).scalar()
-                payload["annotations_terms_count"] = conn.execute(text("SELECT COUNT(*) FROM ns.annotations_terms")).scalar()
+                payload["coordinates_count"] = (await conn.execute(text("SELECT COUNT(*) FROM ns.coordinates"))).scalar()
+                payload["metadata_count"] = (await conn.execute(text("SELECT COUNT(*) FROM ns.metadata"))).scalar()
+                payload["annotations_terms_count"] = (await conn.execute(text("SELECT COUNT(*) FROM ns.annotations_terms"))).scalar()
 
                 # Samples
                 try:
-                    rows = conn.execute(text(
-                        "SELECT study_id, (geom::text) AS geom_wkt FROM ns.coordinates LIMIT 3"
-                    )).mappings().all()
+                    rows = (await conn.execute(text(
+                        "SELECT study_id, ST_X(geom) AS x, ST_Y(geom) AS y, coalesce(ST_Z(geom), 0::float8) AS z FROM ns.coordinates LIMIT 3"
+                    ))).mappings().all()
                     payload["coordinates_sample"] = []
                     for r in rows:
-                        coords = _parse_wkt_point(r.get('geom_wkt'))
-                        payload["coordinates_sample"].append({"study_id": r.get('study_id'), "coords": coords})
+                        payload["coordinates_sample"].append({"study_id": r.get('study_id'), "coords": row_point(r)})
                 except Exception:
                     payload["coordinates_sample"] = []
 
                 try:
                     # Select a few columns if they exist; otherwise select a generic subset
-                    rows = conn.execute(text("SELECT * FROM ns.metadata LIMIT 3")).mappings().all()
+                    rows = (await conn.execute(text("SELECT * FROM ns.metadata LIMIT 3"))).mappings().all()
                     payload["metadata_sample"] = [dict(r) for r in rows]
                 except Exception:
                     payload["metadata_sample"] = []
 
                 try:
-                    rows = conn.execute(text(
+                    rows = (await conn.execute(text(
                         "SELECT study_id, contrast_id, term, weight FROM ns.annotations_terms LIMIT 3"
-                    )).mappings().all()
+                    ))).mappings().all()
                     payload["annotations_terms_sample"] = [dict(r) for r in rows]
                 except Exception:
                     payload["annotations_terms_sample"] = []
 
             payload["ok"] = True
-            return jsonify(payload), 200
+            return ORJSONResponse(payload, status_code=200)
 
         except Exception as e:
             payload["error"] = str(e)
-            return jsonify(payload), 500
+            return ORJSONResponse(payload, status_code=500)
 
-    @app.get('/debug/geom-type', endpoint='debug_geom')
-    def debug_geom_type():
-        """Return pg_typeof for ns.coordinates.geom and a sample geom::text to help diagnose PostGIS type issues."""
+    @app.get('/debug/geom-type', name='debug_geom')
+    async def debug_geom_type():
+        """Return pg_typeof for ns.coordinates.geom, a sample geom::text and the GiST/SP-GiST indexes on it
+        to help diagnose PostGIS type issues and KNN (`<->`) queries falling back to seq-scan + sort."""
         eng = get_engine()
         try:
-            with eng.begin() as conn:
-                conn.execute(text("SET search_path TO ns, public;"))
-                t = conn.execute(text("SELECT pg_typeof(geom) AS t, (geom::text) AS sample FROM ns.coordinates LIMIT 1;"))
+            async with eng.begin() as conn:
+                t = await conn.execute(text("SELECT pg_typeof(geom) AS t, (geom::text) AS sample FROM ns.coordinates LIMIT 1;"))
                 row = t.mappings().first()
                 if not row:
-                    return jsonify({"found": False, "msg": "no rows in ns.coordinates"}), 200
-                return jsonify({"found": True, "pg_typeof": str(row["t"]), "sample_text": row["sample"]}), 200
+                    return ORJSONResponse({"found": False, "msg": "no rows in ns.coordinates"}, status_code=200)
+                knn_indexes = (await conn.execute(text("""
+                    SELECT indexname FROM pg_indexes
+                    WHERE schemaname = 'ns' AND tablename = 'coordinates'
+                      AND indexdef ~* 'USING (gist|spgist) \\(geom\\)'
+                """))).scalars().all()
+                return ORJSONResponse({"found": True, "pg_typeof": str(row["t"]), "sample_text": row["sample"],
+                                     "knn_indexes": knn_indexes}, status_code=200)
         except Exception as e:
-            return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
-
-        @app.get("/ui", endpoint="ui")
-        def ui():
-                # Minimal single-page UI to query the API endpoints from a browser
-                html = """
-                <!doctype html>
-                <html>
-                <head>
-                    <meta charset="utf-8" />
-                    <title>NeuralInfo — quick UI</title>
-                    <style>body{font-family:system-ui,Arial;max-width:900px;margin:40px;} textarea{width:100%;height:320px}</style>
-                </head>
-                <body>
-                    <h1>NeuralInfo — quick UI</h1>
-
-                    <section>
-                        <h2>Query by term</h2>
-                        <input id="term" placeholder="posterior_cingulate" style="width:60%" />
-                        <button onclick="runTerm()">Query</button>
-                    </section>
-
-                    <section style="margin-top:18px;">
-                        <h2>Query by coordinates</h2>
-                        <input id="coords" placeholder="0_-52_26" style="width:60%" />
-                        <button onclick="runCoords()">Query</button>
-                    </section>
-
-                    <section style="margin-top:18px;">
-                        <h2>Dissociate by two terms</h2>
-                        <input id="term_a" placeholder="ventromedial_prefrontal" style="width:28%" />
-                        <input id="term_b" placeholder="posterior_cingulate" style="width:28%;margin-left:8px;" />
-                        <button onclick="runDissociateTerms()">Dissociate Terms</button>
-                    </section>
-
-                    <section style="margin-top:18px;">
-                        <h2>Results</h2>
-                        <textarea id="out" readonly></textarea>
-                    </section>
-
-                    <script>
-                        async function handleResponse(res){
-                            let txt;
-                            try{
-                                const j = await res.json();
-                                txt = JSON.stringify(j,null,2);
-                            }catch(e){
-                                txt = await res.text();
-                            }
-                            document.getElementById('out').value = txt;
-                        }
-
-                        async function runTerm(){
-                            const t = document.getElementById('term').value.trim();
-                            if(!t){ alert('Enter a term (use underscores for spaces)'); return }
-                            const res = await fetch(`/terms/${encodeURIComponent(t)}/studies`);
-                            await handleResponse(res);
-                        }
-
-                        async function runCoords(){
-                            const c = document.getElementById('coords').value.trim();
-                            if(!c){ alert('Enter coords as x_y_z'); return }
-                            const res = await fetch(`/locations/${encodeURIComponent(c)}/studies`);
-                            await handleResponse(res);
-                        }
-
-                        async function runDissociateTerms(){
-                            const a = document.getElementById('term_a').value.trim();
-                            const b = document.getElementById('term_b').value.trim();
-                            if(!a || !b){ alert('Enter both terms (use underscores for spaces)'); return }
-                            const res = await fetch(`/dissociate/terms/${encodeURIComponent(a)}/${encodeURIComponent(b)}`);
-                            await handleResponse(res);
-                        }
-                    </script>
-                </body>
-                </html>
-                """
-                return html
+            return ORJSONResponse({"error": str(e), "traceback": traceback.format_exc()}, status_code=500)
+
     return app
 
     # Note: unreachable, kept for safety
 
-# WSGI entry point (no __main__)
+# ASGI entry point (no __main__); run with e.g.
+#   uvicorn app:app --workers 4 --http httptools --loop uvloop
 app = create_app()
 
 # Temporary global error handler for debugging: if ?debug=1 is present, return the exception and a short traceback
-@app.errorhandler(Exception)
-def _global_exception_handler(e):
-    from flask import request
-    import traceback, html
-    if request.args.get('debug') == '1':
+@app.exception_handler(Exception)
+async def _global_exception_handler(request: Request, e: Exception):
+    if request.query_params.get('debug') == '1':
         tb = traceback.format_exc()
-        return jsonify({
+        return ORJSONResponse({
             'error': str(e),
             'type': type(e).__name__,
             'traceback': tb
-        }), 500
-    # Otherwise re-raise so normal logging/handlers apply
-    raise e
+        }, status_code=500)
+    # Otherwise fall back to a plain 500; Starlette still logs the exception
+    return PlainTextResponse("Internal Server Error", status_code=500)
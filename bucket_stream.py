@@ -0,0 +1,47 @@
+# bucket_stream.py
+# Incremental JSON encoding for the /dissociate/... responses. Kept free of the
+# web/DB stack (only orjson) so the hand-assembled framing can be unit tested.
+import orjson
+
+BUCKETS = ("a_only", "b_only", "overlap")
+
+
+def row_point(r):
+    """[x, y, z] from a row's x/y/z columns (double precision from ST_X/ST_Y/ST_Z), or None without a geometry.
+
+    2D points come back with z = 0 (coalesced in SQL).
+    """
+    if r["x"] is None:
+        return None
+    return [r["x"], r["y"], r["z"]]
+
+
+async def encode_buckets(rows, head: dict, default=None):
+    """Encode classified dissociate rows as one JSON object, chunk by chunk.
+
+    `rows` is an async iterable of mappings (study_id, bucket, x, y, z, top_terms) ordered by bucket;
+    `head` must be non-empty. Yields the `head` fields, then the a_only / b_only / overlap arrays (empty
+    buckets are backfilled with []), then their counts.
+    """
+    counts = dict.fromkeys(BUCKETS, 0)
+    # open the object without its closing brace: b'{"k":v'
+    yield orjson.dumps(head)[:-1]
+    current = None
+    async for r in rows:
+        bucket = r["bucket"]
+        if bucket != current:
+            yield (b"]" if current else b"") + b',"' + bucket.encode() + b'":['
+            current = bucket
+        item = orjson.dumps({
+            "study_id": r["study_id"],
+            "coords": row_point(r),
+            "top_terms": r["top_terms"]
+        }, default=default)
+        yield item if counts[bucket] == 0 else b"," + item
+        counts[bucket] += 1
+    if current:
+        yield b"]"
+    tail = {k: [] for k, n in counts.items() if n == 0}
+    tail.update({f"{k}_count": n for k, n in counts.items()})
+    # drop the tail's opening brace so it continues the object: b',"k":v}'
+    yield b"," + orjson.dumps(tail)[1:]
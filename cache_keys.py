@@ -0,0 +1,9 @@
+# cache_keys.py
+# Redis key prefixes for the API response cache, shared by app.py (reads/writes)
+# and create_db.py (flushes after a reload). Kept dependency-free so the loader
+# can import it without pulling in the web stack.
+
+# Bump the version segment when the response shape changes
+TERMS_CACHE_PREFIX = "terms:v1:"
+LOCATIONS_CACHE_PREFIX = "locations:v1:"
+CACHE_PREFIXES = (TERMS_CACHE_PREFIX, LOCATIONS_CACHE_PREFIX)
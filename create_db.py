@@ -24,6 +24,8 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.exc import OperationalError, PendingRollbackError
 import time
 
+from cache_keys import CACHE_PREFIXES
+
 
 # -----------------------------
 # Args
@@ -43,6 +45,7 @@ def parse_args():
     ap.add_argument("--stage-chunksize", type=int, default=50000, help="pandas.to_sql() chunksize for staging loads")
     ap.add_argument("--enable-json", action="store_true", help="Also build annotations_json (slow)")
     ap.add_argument("--srid", type=int, default=4326, help="SRID for geometry(POINTZ). Default 4326")
+    ap.add_argument("--redis-url", default=os.getenv("REDIS_URL"), help="Redis URL of the API response cache to flush after loading (default: REDIS_URL env var)")
     return ap.parse_args()
 
 
@@ -304,6 +307,14 @@ def build_annotations(engine: Engine, df: pd.DataFrame, schema: str, batch_cols:
         conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_annotations_terms_term ON {schema}.annotations_terms (term);"))
         conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_annotations_terms_study ON {schema}.annotations_terms (study_id);"))
         conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_annotations_terms_term_study ON {schema}.annotations_terms (term, study_id);"))
+        # Expression index over the same normalization app.py applies to user input, so the
+        # `trim(both '_' from regexp_replace(lower(term), '[\s_]+', '_', 'g')) = :term` lookups are index scans
+        conn.execute(text(rf"""
+            CREATE INDEX IF NOT EXISTS idx_annotations_terms_term_norm ON {schema}.annotations_terms
+            ((trim(both '_' from regexp_replace(lower(term), '[\s_]+', '_', 'g'))));
+        """))
+        # Trigram index for the relaxed `lower(term) LIKE '%...%'` fallback
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_annotations_terms_term_trgm ON {schema}.annotations_terms USING GIN (lower(term) gin_trgm_ops);"))
         conn.execute(text(f"ANALYZE {schema}.annotations_terms;"))
         # Build PK/unique AFTER load to avoid per-row maintenance
         conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_annotations_terms ON {schema}.annotations_terms (study_id, contrast_id, term);"))
@@ -330,6 +341,24 @@ def build_annotations(engine: Engine, df: pd.DataFrame, schema: str, batch_cols:
     print("   … annotations done.")
 
 
+# -----------------------------
+# API response cache (Redis)
+# -----------------------------
+def flush_api_cache(redis_url: str):
+    """Drop the API's cached term/location responses (see app.py) so they don't outlive the reloaded data."""
+    try:
+        import redis
+    except ImportError:
+        print("   … redis not installed; skipping API cache flush")
+        return
+    r = redis.Redis.from_url(redis_url)
+    dropped = 0
+    for prefix in CACHE_PREFIXES:
+        for key in r.scan_iter(match=prefix + "*"):
+            dropped += r.delete(key)
+    print(f"→ API cache: flushed {dropped:,} keys")
+
+
 # -----------------------------
 # Main
 # -----------------------------
@@ -368,6 +397,10 @@ def main():
     print("\n=== Build: annotations ===")
     build_annotations(engine, ann, args.schema, args.batch_cols, enable_json=args.enable_json)
 
+    if args.redis_url:
+        print("\n=== Flush API cache ===")
+        flush_api_cache(args.redis_url)
+
     print("\n=== Ready ===")
     print(f"- coordinates  : {args.schema}.coordinates (geometry(POINTZ,{args.srid}) + GIST)")
     print(f"- metadata     : {args.schema}.metadata (FTS + trigger + GIN)")
@@ -0,0 +1,74 @@
+# db_url.py
+# Translate a libpq-style Postgres URL (as used by psycopg2 and hosting providers)
+# into an SQLAlchemy asyncpg URL plus asyncpg.connect() keyword arguments.
+# Kept free of the web/DB stack so the rewrite can be unit tested.
+import logging
+import shlex
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+log = logging.getLogger(__name__)
+
+# libpq parameters asyncpg understands under its own (identical) name; SQLAlchemy passes them through as strings
+_PASSTHROUGH = {"target_session_attrs"}
+# libpq parameters with no asyncpg equivalent that are safe to ignore (asyncpg negotiates SCRAM itself)
+_IGNORED = {"channel_binding"}
+
+
+def _parse_options(options: str) -> dict:
+    """Parse libpq `options` ("-c key=value -ckey2=value2") into asyncpg server_settings."""
+    settings = {}
+    tokens = shlex.split(options)
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok == "-c" and i + 1 < len(tokens):
+            setting = tokens[i + 1]
+            i += 2
+        elif tok.startswith("-c") and len(tok) > 2:
+            setting = tok[2:]
+            i += 1
+        else:
+            raise ValueError(f"Unsupported DB_URL options value {options!r}: only '-c name=value' settings are supported with asyncpg")
+        name, sep, value = setting.partition("=")
+        if not sep or not name:
+            raise ValueError(f"Malformed '-c {setting}' in DB_URL options; expected name=value")
+        settings[name] = value
+    return settings
+
+
+def to_asyncpg_url(db_url: str):
+    """Rewrite a postgres:// / postgresql:// URL to use the asyncpg driver.
+
+    Returns ``(url, connect_args)``. libpq query parameters that asyncpg does not accept
+    are translated into connect_args (``sslmode`` -> ``ssl``, ``connect_timeout`` -> ``timeout``,
+    ``application_name`` / ``options`` -> ``server_settings``); ``channel_binding`` is ignored with a
+    warning, and any other parameter raises ValueError instead of failing later inside asyncpg.connect().
+    """
+    parsed = urlparse(db_url)
+    scheme = parsed.scheme
+    if scheme in ("postgres", "postgresql") or scheme.startswith("postgresql+"):
+        scheme = "postgresql+asyncpg"
+    query = {}
+    connect_args = {}
+    server_settings = {}
+    for key, value in parse_qsl(parsed.query, keep_blank_values=True):
+        if key in ("sslmode", "ssl"):
+            connect_args["ssl"] = value
+        elif key == "connect_timeout":
+            try:
+                connect_args["timeout"] = float(value)
+            except ValueError:
+                raise ValueError(f"Invalid connect_timeout={value!r} in DB_URL; expected seconds")
+        elif key == "application_name":
+            server_settings["application_name"] = value
+        elif key == "options":
+            server_settings.update(_parse_options(value))
+        elif key in _PASSTHROUGH:
+            query[key] = value
+        elif key in _IGNORED:
+            log.warning("DB_URL parameter %s=%s is not supported by asyncpg and is ignored", key, value)
+        else:
+            raise ValueError(f"DB_URL parameter {key!r} is not supported with the asyncpg driver; remove it from DB_URL")
+    if server_settings:
+        connect_args["server_settings"] = server_settings
+    return urlunparse(parsed._replace(scheme=scheme, query=urlencode(query))), connect_args
@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bucket_stream import encode_buckets
+
+
+async def _rows(rows):
+    for r in rows:
+        yield r
+
+
+def _row(study_id, bucket, coords=(1.0, 2.0, 3.0), top_terms=()):
+    x, y, z = coords if coords is not None else (None, None, 0.0)
+    return {"study_id": study_id, "bucket": bucket, "x": x, "y": y, "z": z, "top_terms": list(top_terms)}
+
+
+class EncodeBucketsTest(unittest.IsolatedAsyncioTestCase):
+    HEAD = {"query_a": [0.0, -52.0, 26.0], "query_b": [-2.0, 50.0, -6.0]}
+
+    async def _encode(self, rows):
+        body = b"".join([chunk async for chunk in encode_buckets(_rows(rows), self.HEAD)])
+        return json.loads(body)
+
+    async def test_no_rows(self):
+        doc = await self._encode([])
+        self.assertEqual(doc, {
+            **self.HEAD,
+            "a_only": [], "b_only": [], "overlap": [],
+            "a_only_count": 0, "b_only_count": 0, "overlap_count": 0,
+        })
+
+    async def test_one_bucket_only(self):
+        doc = await self._encode([_row("s1", "b_only"), _row("s2", "b_only", coords=None)])
+        self.assertEqual(doc["a_only"], [])
+        self.assertEqual(doc["overlap"], [])
+        self.assertEqual(doc["b_only"], [
+            {"study_id": "s1", "coords": [1.0, 2.0, 3.0], "top_terms": []},
+            {"study_id": "s2", "coords": None, "top_terms": []},
+        ])
+        self.assertEqual((doc["a_only_count"], doc["b_only_count"], doc["overlap_count"]), (0, 2, 0))
+        self.assertEqual(doc["query_a"], self.HEAD["query_a"])
+
+    async def test_all_three_buckets(self):
+        terms = [{"term": "default_mode", "weight": 0.5}]
+        doc = await self._encode([
+            _row("s1", "a_only", top_terms=terms),
+            _row("s2", "a_only"),
+            _row("s3", "b_only"),
+            _row("s4", "overlap"),
+            _row("s5", "overlap"),
+            _row("s6", "overlap"),
+        ])
+        self.assertEqual([s["study_id"] for s in doc["a_only"]], ["s1", "s2"])
+        self.assertEqual([s["study_id"] for s in doc["b_only"]], ["s3"])
+        self.assertEqual([s["study_id"] for s in doc["overlap"]], ["s4", "s5", "s6"])
+        self.assertEqual(doc["a_only"][0]["top_terms"], terms)
+        self.assertEqual((doc["a_only_count"], doc["b_only_count"], doc["overlap_count"]), (2, 1, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db_url import to_asyncpg_url
+
+
+class ToAsyncpgUrlTest(unittest.TestCase):
+    def test_scheme_is_rewritten(self):
+        for scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+            url, connect_args = to_asyncpg_url(f"{scheme}://u:p@db.example:5432/ns")
+            self.assertEqual(url, "postgresql+asyncpg://u:p@db.example:5432/ns")
+            self.assertEqual(connect_args, {})
+
+    def test_libpq_params_become_connect_args(self):
+        url, connect_args = to_asyncpg_url(
+            "postgresql://u:p@h/db?sslmode=require&connect_timeout=10"
+            "&application_name=loader&options=-c%20statement_timeout%3D5000%20-csearch_path%3Dns"
+            "&target_session_attrs=read-write"
+        )
+        self.assertEqual(url, "postgresql+asyncpg://u:p@h/db?target_session_attrs=read-write")
+        self.assertEqual(connect_args, {
+            "ssl": "require",
+            "timeout": 10.0,
+            "server_settings": {"application_name": "loader", "statement_timeout": "5000", "search_path": "ns"},
+        })
+
+    def test_channel_binding_is_dropped(self):
+        with self.assertLogs("db_url", level="WARNING"):
+            url, connect_args = to_asyncpg_url("postgresql://u:p@h/db?sslmode=require&channel_binding=require")
+        self.assertEqual(url, "postgresql+asyncpg://u:p@h/db")
+        self.assertEqual(connect_args, {"ssl": "require"})
+
+    def test_unsupported_params_are_rejected(self):
+        for query in ("keepalives=1", "connect_timeout=soon", "options=--geqo%3Doff"):
+            with self.subTest(query=query), self.assertRaises(ValueError):
+                to_asyncpg_url(f"postgresql://u:p@h/db?{query}")
+
+
+if __name__ == "__main__":
+    unittest.main()